@@ -1,5 +1,61 @@
+import collections
 import itertools
 import random
+import sys
+
+import numpy as np
+
+try:
+    from scipy.signal import convolve2d
+except ImportError:
+    convolve2d = None
+
+# Relative positions of the 8 cells surrounding a cell
+_NEIGHBOR_OFFSETS = ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))
+
+# Weights of the 8 cells surrounding a cell, the cell itself excluded
+_NEIGHBOR_KERNEL = np.array([[1, 1, 1], [1, 0, 1], [1, 1, 1]], dtype=np.int8)
+
+
+def _neighbor_counts(board):
+    """
+    Returns, for every cell of a boolean board, the number of
+    neighboring cells that are True, as an int8 array of the same shape.
+    """
+    if convolve2d is not None:
+        return convolve2d(
+            board.astype(np.int8), _NEIGHBOR_KERNEL, mode="same", boundary="fill", fillvalue=0
+        ).astype(np.int8)
+
+    # Without scipy, add up the 8 shifted copies of the zero-padded board
+    height, width = board.shape
+    padded = np.pad(board.astype(np.int8), 1)
+    counts = np.zeros((height, width), dtype=np.int8)
+    for di, dj in _NEIGHBOR_OFFSETS:
+        counts += padded[1 + di:1 + di + height, 1 + dj:1 + dj + width]
+    return counts
+
+
+def _pack(cells, width):
+    """
+    Returns an int bitmap of cells, where cell (i, j) is bit i * width + j.
+    """
+    bits = 0
+    for i, j in cells:
+        bits |= 1 << (i * width + j)
+    return bits
+
+
+def _unpack(bits, width):
+    """
+    Returns the set of (i, j) cells whose bits are set in an int bitmap.
+    """
+    cells = set()
+    while bits:
+        lowest = bits & -bits
+        cells.add(divmod(lowest.bit_length() - 1, width))
+        bits ^= lowest
+    return cells
 
 
 class Minesweeper():
@@ -12,23 +68,18 @@ class Minesweeper():
         # Set initial width, height, and number of mines
         self.height = height
         self.width = width
-        self.mines = set()
 
         # Initialize an empty field with no mines
-        self.board = []
-        for i in range(self.height):
-            row = []
-            for j in range(self.width):
-                row.append(False)
-            self.board.append(row)
-
-        # Add mines randomly
-        while len(self.mines) != mines:
-            i = random.randrange(height)
-            j = random.randrange(width)
-            if not self.board[i][j]:
-                self.mines.add((i, j))
-                self.board[i][j] = True
+        self.board = np.zeros((height, width), dtype=bool)
+
+        # Add mines randomly, drawing distinct flat indices of the board
+        flat = random.sample(range(height * width), mines)
+        self.mines = {divmod(k, width) for k in flat}
+        self.board.flat[flat] = True
+
+        # Number of nearby mines of every cell, computed once for the whole board
+        # and kept as nested lists of Python ints, which are much cheaper to read one cell at a time
+        self._count_rows = _neighbor_counts(self.board).tolist()
 
         # At first, player has found no mines
         self.mines_found = set()
@@ -38,19 +89,18 @@ class Minesweeper():
         Prints a text-based representation
         of where mines are located.
         """
+        # Build the whole drawing first, then write it at once
+        sep = "--" * self.width + "-\n"
+        out = []
         for i in range(self.height):
-            print("--" * self.width + "-")
-            for j in range(self.width):
-                if self.board[i][j]:
-                    print("|X", end="")
-                else:
-                    print("| ", end="")
-            print("|")
-        print("--" * self.width + "-")
+            out.append(sep)
+            out.append("".join("|X" if self.board[i, j] else "| " for j in range(self.width)))
+            out.append("|\n")
+        out.append(sep)
+        sys.stdout.write("".join(out))
 
     def is_mine(self, cell):
-        i, j = cell
-        return self.board[i][j]
+        return bool(self.board[cell])
 
     def nearby_mines(self, cell):
         """
@@ -58,24 +108,8 @@ class Minesweeper():
         within one row and column of a given cell,
         not including the cell itself.
         """
-
-        # Keep count of nearby mines
-        count = 0
-
-        # Loop over all cells within one row and column
-        for i in range(cell[0] - 1, cell[0] + 2):
-            for j in range(cell[1] - 1, cell[1] + 2):
-
-                # Ignore the cell itself
-                if (i, j) == cell:
-                    continue
-
-                # Update count if cell in bounds and is mine
-                if 0 <= i < self.height and 0 <= j < self.width:
-                    if self.board[i][j]:
-                        count += 1
-
-        return count
+        i, j = cell
+        return self._count_rows[i][j]
 
     def won(self):
         """
@@ -91,9 +125,17 @@ class Sentence():
     and a count of the number of those cells which are mines.
     """
 
+    __slots__ = ("cells", "count", "_frozen", "_known_cache", "_bits")
+
     def __init__(self, cells, count):
         self.cells = set(cells)
         self.count = count
+        # Frozen copy of self.cells, built on demand by key()
+        self._frozen = None
+        # (known mines, known safes) pair, built on demand by known_mines() and known_safes()
+        self._known_cache = None
+        # (width, bitmap of self.cells) pair, built on demand by bits()
+        self._bits = None
 
     def __eq__(self, other):
         return self.cells == other.cells and self.count == other.count
@@ -101,49 +143,115 @@ class Sentence():
     def __str__(self):
         return f"{self.cells} = {self.count}"
 
+    def key(self):
+        """
+        Returns a hashable (cells, count) pair identifying the sentence.
+        """
+        if self._frozen is None:
+            self._frozen = frozenset(self.cells)
+        return (self._frozen, self.count)
+
+    def bits(self, width):
+        """
+        Returns self.cells as an int bitmap for a board of the given width.
+        """
+        if self._bits is None or self._bits[0] != width:
+            self._bits = (width, _pack(self.cells, width))
+        return self._bits[1]
+
+    def _known(self):
+        """
+        Returns the (known mines, known safes) pair of frozensets,
+        computing it only once between two modifications of the sentence.
+        """
+        if self._known_cache is None:
+            cells = self.key()[0]
+            # The only way to know for sure that a cell is a mine, is if the lenght of the sentence is the same as the count
+            mines = cells if len(cells) == self.count and self.count != 0 else frozenset()
+            safes = cells if self.count == 0 else frozenset()
+            self._known_cache = (mines, safes)
+        return self._known_cache
+
     def known_mines(self):
         """
         Returns the set of all cells in self.cells known to be mines.
         """
-        # The only way to know for sure that a cell is a mine, is if the lenght of the sentence is the same as the count
-        if len(self.cells) == self.count and self.count != 0:
-            return self.cells
-        else:
-            return set()
+        return self._known()[0]
 
     def known_safes(self):
         """
         Returns the set of all cells in self.cells known to be safe.
         """
-        if self.count == 0:
-            return self.cells
-        else:
-            return set()
+        return self._known()[1]
+
+    def _invalidate(self):
+        """
+        Drops the values cached from self.cells, after the sentence was modified.
+        """
+        self._frozen = None
+        self._known_cache = None
+        self._bits = None
 
     def mark_mine(self, cell):
         """
         Updates internal knowledge representation given the fact that
         a cell is known to be a mine.
+        Returns True if the sentence was changed.
         """
         # 1.First check if the cell is part of self.cells
         if cell in self.cells:
             
             # 2. Remove the cell form the sentence
             self.cells.remove(cell)
+            self._invalidate()
             # Remove a count because there is one less mine in the set
             self.count -= 1
+            return True
+        return False
 
     def mark_safe(self, cell):
         """
         Updates internal knowledge representation given the fact that
         a cell is known to be safe.
+        Returns True if the sentence was changed.
         """
        # 1.First check if the cell is part of self.cells
         if cell in self.cells:
             
             # 2. Remove the cell form the sentence
             self.cells.remove(cell)
+            self._invalidate()
             # In this case, we do not modify the count because there are still as many mines in the set
+            return True
+        return False
+
+    def mark_mines(self, cells):
+        """
+        Updates internal knowledge representation given the fact that
+        all the given cells are known to be mines.
+        Returns True if the sentence was changed.
+        """
+        found = self.cells & cells
+        if found:
+            self.cells -= found
+            self._invalidate()
+            # One less mine in the set for each cell removed
+            self.count -= len(found)
+            return True
+        return False
+
+    def mark_safes(self, cells):
+        """
+        Updates internal knowledge representation given the fact that
+        all the given cells are known to be safe.
+        Returns True if the sentence was changed.
+        """
+        found = self.cells & cells
+        if found:
+            self.cells -= found
+            self._invalidate()
+            return True
+        return False
 
 
 class MinesweeperAI():
@@ -163,28 +271,237 @@ class MinesweeperAI():
         # Keep track of cells known to be safe or mines
         self.mines = set()
         self.safes = set()
+        # Cells known to be safe that have not been played yet
+        self._safe_unplayed = set()
+
+        # Cells that are neither played nor known to be mines, i.e. the possible random moves
+        self._candidates = np.ones((height, width), dtype=bool)
+
+        # Sentences about the game known to be true
+        self.knowledge = collections.deque()
+
+        # Sentences of the KB indexed by their key, kept up to date as sentences change, used to avoid duplicated sentences
+        self._kb_index = {}
 
-        # List of sentences about the game known to be true
-        self.knowledge = []
-        #self.knowledge: list[Sentence] = []
+        # For each cell, the list of sentences of the KB that contain it
+        self._cell_to_sentences = {}
+
+        # For each size, the sentences of the KB with that many cells, by id
+        self._by_size = {}
 
     def mark_mine(self, cell):
         """
         Marks a cell as a mine, and updates all knowledge
         to mark that cell as a mine as well.
+        Returns the list of sentences that were changed.
         """
         self.mines.add(cell)
-        for sentence in self.knowledge:
-            sentence.mark_mine(cell)
+        self._candidates[cell] = False
+        # Only the sentences containing the cell need to be updated, and none of them will contain it afterwards
+        return self._update_sentences(self._cell_to_sentences.pop(cell, ()), lambda sentence: sentence.mark_mine(cell))
 
     def mark_safe(self, cell):
         """
         Marks a cell as safe, and updates all knowledge
         to mark that cell as safe as well.
+        Returns the list of sentences that were changed.
         """
         self.safes.add(cell)
-        for sentence in self.knowledge:
-            sentence.mark_safe(cell)
+        if cell not in self.moves_made:
+            self._safe_unplayed.add(cell)
+        return self._update_sentences(self._cell_to_sentences.pop(cell, ()), lambda sentence: sentence.mark_safe(cell))
+
+    def _update_sentences(self, sentences, update):
+        """
+        Calls update on each sentence, re-indexing the sentences it changes
+        under their new key and in the bucket of their new size.
+        Returns the list of sentences that were changed.
+        """
+        changed = []
+        for sentence in sentences:
+            key, size = sentence.key(), len(sentence.cells)
+            if update(sentence):
+                if self._kb_index.get(key) is sentence:
+                    del self._kb_index[key]
+                self._by_size[size].pop(id(sentence), None)
+                self._index(sentence)
+                changed.append(sentence)
+        return changed
+
+    def _pop_sentences(self, cells):
+        """
+        Removes the given cells from self._cell_to_sentences and returns
+        the sentences that contained at least one of them, each only once.
+        """
+        sentences = {}
+        for cell in cells:
+            for sentence in self._cell_to_sentences.pop(cell, ()):
+                sentences[id(sentence)] = sentence
+        return sentences.values()
+
+    def mark_mines(self, cells):
+        """
+        Marks every given cell as a mine, updating each sentence
+        of the knowledge only once for the whole batch.
+        Returns the list of sentences that were changed.
+        """
+        cells = frozenset(cells)
+        self.mines |= cells
+        for cell in cells:
+            self._candidates[cell] = False
+        return self._update_sentences(self._pop_sentences(cells), lambda sentence: sentence.mark_mines(cells))
+
+    def mark_safes(self, cells):
+        """
+        Marks every given cell as safe, updating each sentence
+        of the knowledge only once for the whole batch.
+        Returns the list of sentences that were changed.
+        """
+        cells = frozenset(cells)
+        self.safes |= cells
+        self._safe_unplayed |= cells - self.moves_made
+        return self._update_sentences(self._pop_sentences(cells), lambda sentence: sentence.mark_safes(cells))
+
+    def _index(self, sentence):
+        """
+        Indexes a sentence by its key, unless another sentence already has it, and by its size.
+        """
+        self._kb_index.setdefault(sentence.key(), sentence)
+        self._by_size.setdefault(len(sentence.cells), {})[id(sentence)] = sentence
+
+    def _add_sentence(self, sentence):
+        """
+        Appends a sentence to the KB and indexes it by its key, its size and each of its cells.
+        """
+        self.knowledge.append(sentence)
+        self._index(sentence)
+        for cell in sentence.cells:
+            self._cell_to_sentences.setdefault(cell, []).append(sentence)
+
+    def _prune_sentences(self):
+        """
+        Removes in place the sentences of the KB that have no cell left,
+        or that have become identical to another sentence.
+        """
+        # Rotating the deque keeps the order of the remaining sentences
+        for _ in range(len(self.knowledge)):
+            sentence = self.knowledge.popleft()
+            if self._is_live(sentence):
+                self.knowledge.append(sentence)
+            else:
+                self._unindex(sentence)
+
+    def _unindex(self, sentence):
+        """
+        Removes a sentence leaving the KB from all the indexes.
+        """
+        key = sentence.key()
+        if self._kb_index.get(key) is sentence:
+            del self._kb_index[key]
+        self._by_size[len(sentence.cells)].pop(id(sentence), None)
+        # An empty sentence has no cell left, so it is already absent from self._cell_to_sentences
+        for cell in sentence.cells:
+            self._cell_to_sentences[cell] = [other for other in self._cell_to_sentences[cell] if other is not sentence]
+
+    def _is_live(self, sentence):
+        """
+        Returns True if the sentence has cells and is the one indexed under its key.
+        """
+        return bool(sentence.cells) and self._kb_index.get(sentence.key()) is sentence
+
+    def _propagate(self, sentences):
+        """
+        Marks every cell known to be a mine or safe from the given sentences,
+        re-checking each sentence changed along the way until nothing new can be concluded.
+        Returns the list of sentences that were changed.
+        """
+        changed = []
+        dirty = collections.deque(sentences)
+        while dirty:
+            sentence = dirty.popleft()
+            # Creation of a set which will contain only mines if created
+            mines = sentence.known_mines()
+            # Same principle for safe cells
+            safes = sentence.known_safes()
+            # Both sets are frozen snapshots, so marking their cells cannot alter them
+            if mines:
+                marked = self.mark_mines(mines)
+            elif safes:
+                marked = self.mark_safes(safes)
+            else:
+                continue
+            changed.extend(marked)
+            dirty.extend(marked)
+        return changed
+
+    def _live(self, sentences):
+        """
+        Returns the given sentences that are still live, each only once.
+        """
+        return list({id(sentence): sentence for sentence in sentences if self._is_live(sentence)}.values())
+
+    def _difference(self, sentence, other):
+        """
+        Returns the (cells, count) pair inferred from two sentences when one
+        is a proper subset of the other, or None otherwise.
+        """
+        bits = sentence.bits(self.width)
+        otherBits = other.bits(self.width)
+        commonBits = bits & otherBits
+        if bits == otherBits:
+            return None
+        if commonBits == bits:
+            subSetSentence, superSetSentence = sentence, other
+            infferedBits = otherBits & ~bits
+        elif commonBits == otherBits:
+            subSetSentence, superSetSentence = other, sentence
+            infferedBits = bits & ~otherBits
+        else:
+            return None
+        return _unpack(infferedBits, self.width), superSetSentence.count - subSetSentence.count
+
+    def _infer(self, sentences):
+        """
+        Compares the given sentences with the rest of the KB and adds, or resolves right away,
+        the sentences that can be inferred, re-checking each sentence added or changed along the way.
+        Returns the list of sentences that were added or changed.
+        """
+        changed = []
+        pending = list(sentences)
+        while pending:
+            currentSentence = pending.pop()
+            # A sentence may have been emptied or made identical to another one since it was queued
+            if not self._is_live(currentSentence):
+                continue
+            for size, bucket in list(self._by_size.items()):
+                # Sentences of the same size can never be a proper subset of each other
+                # Cells resolved below may shrink the current sentence, so its size is read again
+                if size == len(currentSentence.cells):
+                    continue
+                for sentence in list(bucket.values()):
+                    # Cells resolved below may also move a sentence out of the bucket being scanned
+                    if len(sentence.cells) == len(currentSentence.cells):
+                        continue
+                    inferred = self._difference(currentSentence, sentence)
+                    if inferred is None:
+                        continue
+                    infferedCells, infferedCount = inferred
+                    # A sentence whose cells are all safe or all mines is resolved right away instead of being added to the KB
+                    if infferedCount == 0:
+                        marked = self.mark_safes(infferedCells)
+                    elif infferedCount == len(infferedCells):
+                        marked = self.mark_mines(infferedCells)
+                    else:
+                        infferedSentence = Sentence(infferedCells, infferedCount)
+                        # Add the new sentence to the KB if not already there
+                        if infferedSentence.key() in self._kb_index:
+                            continue
+                        self._add_sentence(infferedSentence)
+                        marked = [infferedSentence]
+                    # The sentences added or shrunk may in turn lead to new inferences
+                    changed.extend(marked)
+                    pending.extend(marked)
+        return changed
 
     def add_knowledge(self, cell, count):
         """
@@ -203,85 +520,43 @@ class MinesweeperAI():
         """
         # 1)Add cell to move made
         self.moves_made.add(cell)
+        self._safe_unplayed.discard(cell)
+        self._candidates[cell] = False
         # 2)Mark cell as safe
-        self.mark_safe(cell)
+        # Sentences changed during this call may now be a subset of another sentence, so they are kept for step 5
+        changedSentences = self.mark_safe(cell)
         # 3)add new sentence to the AI KB
-        # 3.1) Lets first create the set of all the cell's neighbors
-        neighbors = set()
-        for i in range(cell[0] - 1, cell[0] + 2):
-            for j in range(cell[1] - 1, cell[1] + 2):
-                # We don't want to add the cell itself
-                if (i, j) == cell:
-                    continue
-                
-                # IF the cell is inside the board, we add it to the neighbors set()
-                
-                if 0 <= i < self.height and 0 <= j < self.width:
-
-                    #If the cell is known to be a mine, we decrease the count and do not add it to the set
-                    if ((i, j) in self.mines):
-                        count -= 1
-                        continue
-
-                    #If the cell is not marked as safe, we add it to the set
-                    if not((i, j) in self.safes):
-                        neighbors.add((i, j))
+        # 3.1) Lets first create the set of all the cell's neighbors that are inside the board
+        i, j = cell
+        neighbors = {
+            (i + di, j + dj) for di, dj in _NEIGHBOR_OFFSETS
+            if 0 <= i + di < self.height and 0 <= j + dj < self.width
+        }
+        # Neighbors known to be mines are removed from the set and from the count
+        count -= len(neighbors & self.mines)
+        # Neighbors known to be safe tell us nothing, so they are removed as well
+        neighbors = neighbors - self.mines - self.safes
 
         # Creation of the new sentence
         newSentence = Sentence(neighbors, count)
         # Let's add this new sentence to the KB
-        self.knowledge.append(newSentence)
+        self._add_sentence(newSentence)
 
         # 4 Mark any additional cells as safe of as mines
+        changedSentences += self._propagate(self.knowledge)
 
-        for sentence in self.knowledge:
-            # Creation of a set which will contain only mines if created
-            mines = sentence.known_mines()
-            # Same principle for safe cells
-            safes = sentence.known_safes()
-            if mines:
-                #Iterating on a copy of the set to avoid potential errors
-                for cell in mines.copy():
-                    self.mark_mine(cell)
-            elif safes:
-                for cell in safes.copy():
-                    self.mark_safe(cell)
-
-        # We now need to delete any sentence that would be empty
-        # To do so, list comprehension will be used : https://www.w3schools.com/python/python_lists_comprehension.asp
-
-        self.knowledge = [sentence for sentence in self.knowledge if sentence != Sentence(set(), 0)]
-
-        # 5.1 Lets check if the new sentence is a subset of any existing sentences in the KB
+        # We now need to delete any sentence that would be empty or duplicated
+        self._prune_sentences()
 
-        for subSetSentence in self.knowledge:
-            for superSetSentence in self.knowledge:
-            # If the subSetSentence is a subset of superSetSentence, we can inffer a new sentence
-                if subSetSentence.cells < superSetSentence.cells:
-                    infferedCells = superSetSentence.cells - subSetSentence.cells
-                    infferedCount = superSetSentence.count - subSetSentence.count
-                    infferedSentence = Sentence(infferedCells, infferedCount)
-                    # Add the new sentence to the KB if not already there
-                    if infferedSentence not in self.knowledge:
-                        self.knowledge.append(infferedSentence)
-
-        # Repeate step 4 to see if we can inffer new mines based on the new sentence(s)
-        for sentence in self.knowledge:
-            # Creation of a set which will contain only mines if created
-            mines = sentence.known_mines()
-            # Same principle for safe cells
-            safes = sentence.known_safes()
-            if mines:
-                #Iterating on a copy of the set to avoid potential errors
-                for cell in mines.copy():
-                    self.mark_mine(cell)
-            elif safes:
-                for cell in safes.copy():
-                    self.mark_safe(cell)
+        # 5.1 Lets check if the new or changed sentences are a subset or a superset of any existing sentences in the KB
+        # Only sentences added or changed during this call need to be compared with the rest of the KB
+        newSentences = self._live([newSentence] + changedSentences)
+        while newSentences:
+            # Repeate step 4 on the sentences inferred or changed, and compare the sentences it changes again
+            newSentences = self._live(self._propagate(self._infer(newSentences)))
 
+        self._prune_sentences()
 
-        self.knowledge = [sentence for sentence in self.knowledge if sentence != Sentence(set(), 0)]
-                
     def make_safe_move(self):
         """
         Returns a safe cell to choose on the Minesweeper board.
@@ -291,13 +566,8 @@ class MinesweeperAI():
         This function may use the knowledge in self.mines, self.safes
         and self.moves_made, but should not modify any of those values.
         """
-        # We first look is there are known safe cells, and then check if one of these cells has not been played yet
-        if len(self.safes) > 0:
-            for cell in self.safes:
-                if cell not in self.moves_made:
-                    return cell
-        # Otherwise, return None
-        return None
+        # Known safe cells are added to self._safe_unplayed and removed from it once played, None if there is none
+        return next(iter(self._safe_unplayed), None)
 
     def make_random_move(self):
         """
@@ -306,16 +576,12 @@ class MinesweeperAI():
             1) have not already been chosen, and
             2) are not known to be mines
         """
-        #Create a set of eventual possible moves
-        eventualMoves = set()
-        for i in range(0, self.height):
-            for j in range(0, self.width):
-                if (i, j) not in self.moves_made and (i, j) not in self.mines:
-                    #If (i, j) is has not been played yet and is not known to be a mine, we return it
-                    eventualMoves.add((i, j))
+        # Flat indices of the cells still available for a random move
+        eventualMoves = np.flatnonzero(self._candidates)
 
         if len(eventualMoves) == 0:
             return None
         else:
-            #If the set is not empty, we return a random element of it
-            return eventualMoves.pop()
+            #If there are possible moves, we return a random one of them
+            i, j = divmod(int(eventualMoves[random.randrange(len(eventualMoves))]), self.width)
+            return (i, j)